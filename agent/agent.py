@@ -37,6 +37,8 @@ def log(message):
     except:
         pass # Fallback if permission denied
 
+CONFIG = {}
+
 def load_config():
     config_path = os.path.join(APP_DIR, 'config.json')
     # Print to console for immediate debug
@@ -48,6 +50,7 @@ def load_config():
         try:
             with open(config_path, 'r') as f:
                 config = json.load(f)
+                CONFIG.update(config)
                 url = config.get('server_url', DEFAULT_SERVER_URL)
                 log(f"Config loaded. URL: {url}")
                 print(f"DEBUG: Config loaded. URL: {url}")
@@ -63,6 +66,11 @@ def load_config():
     return DEFAULT_SERVER_URL
 
 SERVER_URL = load_config()
+# Geolocation is resolved by the server from the source IP; the local
+# ipinfo.io lookup is only kept for setups that explicitly enable it.
+COLLECT_GEOLOCATION = bool(CONFIG.get('collect_geolocation', False))
+# Command acknowledgements go to the same server, next to /api/report
+ACK_URL = SERVER_URL.rsplit('/api/', 1)[0] + '/api/command_ack'
 
 
 
@@ -93,9 +101,6 @@ def get_system_info():
     except:
         return {}
 
-    except:
-        return {}
-
 def get_memory_info():
     try:
         svmem = psutil.virtual_memory()
@@ -356,8 +361,10 @@ def collect_and_send():
     print("Collecting hardware info...")
     manufacturer, serial = get_windows_hardware_info()
     
-    print("Collecting geolocation...")
-    geo = get_geolocation()
+    geo = None
+    if COLLECT_GEOLOCATION:
+        print("Collecting geolocation...")
+        geo = get_geolocation()
     
     print("Collecting software list (this may take a moment)...")
     software = get_installed_software()
@@ -406,12 +413,23 @@ def collect_and_send():
             try:
                 resp_json = response.json()
                 command = resp_json.get('command')
+                command_id = resp_json.get('command_id')
                 if command:
                     log(f"⚠️ Received remote command: {command}")
+                    exit_code = None
                     if command == 'restart':
-                        os.system("shutdown /r /t 10 /f /c \"Reinicio solicitado pelo administrador SGML\"")
+                        exit_code = os.system("shutdown /r /t 10 /f /c \"Reinicio solicitado pelo administrador SGML\"")
                     elif command == 'shutdown':
-                        os.system("shutdown /s /t 10 /f /c \"Desligamento solicitado pelo administrador SGML\"")
+                        exit_code = os.system("shutdown /s /t 10 /f /c \"Desligamento solicitado pelo administrador SGML\"")
+                    # Bulk commands carry an id; report the outcome before the machine goes down
+                    if command_id is not None:
+                        ack = {
+                            "uuid": unique_id,
+                            "command_id": command_id,
+                            "status": "done" if exit_code == 0 else "failed",
+                            "result": exit_code
+                        }
+                        requests.post(ACK_URL, data=json.dumps(ack), headers=headers, timeout=5)
             except Exception as e:
                 log(f"Command Error: {e}")
 
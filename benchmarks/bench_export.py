@@ -0,0 +1,97 @@
+"""
+Benchmark for the streaming export endpoints.
+
+Fills throwaway databases with synthetic machines and streams
+/api/export/machines and /api/export/software through the Flask test client,
+recording time and peak Python memory (tracemalloc) while the response is
+consumed. Peak memory should stay flat between the small and the large fleet.
+Wall time is measured in a separate pass without tracemalloc: it is how long
+one server thread stays busy serving the download.
+
+Usage: python benchmarks/bench_export.py [machines]   (default 50000)
+"""
+import os
+import sys
+import json
+import shutil
+import time
+import sqlite3
+import tempfile
+import datetime
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(), 'bench_init.db'))
+
+import app as server
+
+SOFTWARE_PER_MACHINE = 40
+
+def build_db(path, count):
+    server.DB_FILE = path
+    server.init_db()
+    software = json.dumps([{"name": "Package %d" % i, "version": "1.%d" % i, "vendor": "Vendor %d" % (i % 7)}
+                           for i in range(SOFTWARE_PER_MACHINE)])
+    os_info = json.dumps({"system": "Windows", "release": "10", "version": "10.0.19045", "machine": "AMD64"})
+    now = datetime.datetime.now()
+    db = sqlite3.connect(path)
+    db.executemany('''
+        INSERT INTO machines (id, hostname, ip, os_info, cpu_info, memory_info, disk_info, uptime, last_seen,
+                              manufacturer, serial_number, geolocation, installed_software, metrics, user_info)
+        VALUES (?, ?, ?, ?, '{}', '{}', '[]', 3600, ?, 'Dell Inc.', ?, 'null', ?, '{}', '{}')
+    ''', (("M%06d" % i, "HOST-%06d" % i, "10.0.%d.%d" % (i // 256 % 256, i % 256), os_info, now, "SN%06d" % i, software)
+          for i in range(count)))
+    db.commit()
+    db.close()
+
+def consume(client, url):
+    response = client.get(url, buffered=False)
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    return size
+
+def measure(client, url):
+    start = time.perf_counter()
+    size = consume(client, url)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    consume(client, url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+def main():
+    large = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    small = max(large // 10, 1)
+    tmp = tempfile.mkdtemp()
+    client = server.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user'] = 'bench'
+
+    urls = [
+        '/api/export/machines',
+        '/api/export/machines?format=csv&fields=id,hostname,os,software',
+        '/api/export/machines?gzip=1',
+        '/api/export/software?format=csv',
+    ]
+    peaks = {}
+    try:
+        for count in (small, large):
+            path = os.path.join(tmp, 'bench_%d.db' % count)
+            build_db(path, count)
+            print("== %d machines" % count)
+            for url in urls:
+                elapsed, peak, size = measure(client, url)
+                peaks.setdefault(url, []).append(peak)
+                print("  %-65s %7.2fs  %8.1f MB out  peak %6.2f MB" % (url, elapsed, size / 2**20, peak / 2**20))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print("== peak memory ratio (%d vs %d machines)" % (large, small))
+    for url, (p_small, p_large) in peaks.items():
+        print("  %-65s x%.2f" % (url, p_large / p_small))
+
+if __name__ == '__main__':
+    main()
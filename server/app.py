@@ -3,11 +3,37 @@ import json
 import datetime
 import os
 import functools
-from flask import Flask, render_template, request, jsonify, g, session, redirect, url_for
+import csv
+import io
+import zlib
+import bisect
+import ipaddress
+from flask import Flask, Response, render_template, request, jsonify, g, session, redirect, url_for
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+# Optional: MaxMind .mmdb support for server-side geolocation
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'sgml_secret_key_fixed_2025')
 DB_FILE = os.environ.get('DB_PATH', 'machines.db')
+GEOIP_DB = os.environ.get('GEOIP_DB')
+GEOIP_CACHE_SIZE = int(os.environ.get('GEOIP_CACHE_SIZE', 4096))
+# Seconds a bulk command may wait: delivered without an answer (then failed) or
+# released but undelivered because the machine is offline (then expired)
+COMMAND_TIMEOUT = int(os.environ.get('COMMAND_TIMEOUT', 3600))
+
+# Behind a reverse proxy (Render, nginx...) trust N X-Forwarded-For hops
+if os.environ.get('TRUST_PROXY'):
+    try:
+        proxy_hops = int(os.environ['TRUST_PROXY'])
+    except ValueError:
+        app.logger.warning("TRUST_PROXY=%r is not a number of proxies; assuming 1", os.environ['TRUST_PROXY'])
+        proxy_hops = 1
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops)
 
 def get_db():
     db = getattr(g, '_database', None)
@@ -25,6 +51,8 @@ def close_connection(exception):
 def init_db():
     with app.app_context():
         db = get_db()
+        # WAL lets /api/report keep writing while a streamed export holds a read cursor
+        db.execute("PRAGMA journal_mode=WAL")
         # Create table for machines
         db.execute('''
             CREATE TABLE IF NOT EXISTS machines (
@@ -55,7 +83,74 @@ def init_db():
             db.execute("ALTER TABLE machines ADD COLUMN pending_command TEXT")
         except:
             pass
-            
+        try:
+            db.execute("ALTER TABLE machines ADD COLUMN public_ip TEXT")
+        except:
+            pass
+
+        # Groups: rule_type NULL = manual membership, otherwise rule-based
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS machine_groups (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                rule_type TEXT,
+                rule_value TEXT,
+                rule_pattern TEXT,
+                created_at TIMESTAMP
+            )
+        ''')
+        try:
+            db.execute("ALTER TABLE machine_groups ADD COLUMN rule_pattern TEXT")
+        except:
+            pass
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS group_members (
+                group_id INTEGER NOT NULL,
+                machine_id TEXT NOT NULL,
+                PRIMARY KEY (group_id, machine_id)
+            )
+        ''')
+        db.execute("CREATE INDEX IF NOT EXISTS idx_group_members_machine ON group_members (machine_id)")
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS machine_tags (
+                machine_id TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                PRIMARY KEY (machine_id, tag)
+            )
+        ''')
+        db.execute("CREATE INDEX IF NOT EXISTS idx_machine_tags_tag ON machine_tags (tag)")
+
+        # Bulk commands: one job per dispatch, one target row per machine
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS command_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                action TEXT NOT NULL,
+                target_type TEXT NOT NULL,
+                target TEXT NOT NULL,
+                wave_size INTEGER,
+                wave_interval INTEGER,
+                created_by TEXT,
+                created_at TIMESTAMP
+            )
+        ''')
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS command_targets (
+                job_id INTEGER NOT NULL,
+                machine_id TEXT NOT NULL,
+                wave INTEGER NOT NULL,
+                release_at REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                sent_at TIMESTAMP,
+                acked_at TIMESTAMP,
+                result TEXT,
+                PRIMARY KEY (job_id, machine_id)
+            )
+        ''')
+        db.execute("CREATE INDEX IF NOT EXISTS idx_command_targets_pending ON command_targets (machine_id, status, release_at)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_command_targets_job ON command_targets (job_id, status)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_command_targets_sent ON command_targets (status, sent_at)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_command_targets_release ON command_targets (status, release_at)")
+
         db.commit()
 
 @app.template_filter('from_json')
@@ -72,6 +167,221 @@ def format_uptime_filter(seconds):
     if seconds is None: return "N/A"
     return str(datetime.timedelta(seconds=int(seconds)))
 
+@app.template_filter('format_timestamp')
+def format_timestamp_filter(ts):
+    if ts is None: return "N/A"
+    return datetime.datetime.fromtimestamp(ts).strftime("%d/%m/%Y %H:%M:%S")
+
+
+# Machine groups / tags
+# Rule patterns accept * and ? wildcards and are stored as LIKE patterns
+# (matched with ESCAPE '\', so literal %, _ and \ stay literal).
+GROUP_RULE_TYPES = {
+    'os': 'Sistema Operacional',
+    'manufacturer': 'Fabricante',
+    'hostname': 'Hostname',
+    'software': 'Software Instalado',
+}
+
+RULE_MATCH_SQL = '''
+    CASE g.rule_type
+        WHEN 'os' THEN (COALESCE(json_extract(m.os_info, '$.system'), '') || ' ' ||
+                        COALESCE(json_extract(m.os_info, '$.release'), '')) LIKE g.rule_value ESCAPE '\\'
+        WHEN 'manufacturer' THEN m.manufacturer LIKE g.rule_value ESCAPE '\\'
+        WHEN 'hostname' THEN m.hostname LIKE g.rule_value ESCAPE '\\'
+        WHEN 'software' THEN EXISTS (
+            SELECT 1 FROM json_each(m.installed_software) s
+            WHERE s.type = 'object' AND json_extract(s.value, '$.name') LIKE g.rule_value ESCAPE '\\'
+        )
+        ELSE 0
+    END
+'''
+
+def wildcard_to_like(pattern):
+    pattern = pattern.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return pattern.replace('*', '%').replace('?', '_')
+
+def refresh_rule_groups(db, machine_id=None, group_id=None):
+    """Recompute rule-based memberships for one machine (on report) or one group (on creation)."""
+    if machine_id is not None:
+        db.execute('''
+            DELETE FROM group_members WHERE machine_id = ?
+            AND group_id IN (SELECT id FROM machine_groups WHERE rule_type IS NOT NULL)
+        ''', (machine_id,))
+        db.execute('''
+            INSERT OR IGNORE INTO group_members (group_id, machine_id)
+            SELECT g.id, m.id FROM machine_groups g, machines m
+            WHERE g.rule_type IS NOT NULL AND m.id = ? AND (%s)
+        ''' % RULE_MATCH_SQL, (machine_id,))
+    elif group_id is not None:
+        db.execute("DELETE FROM group_members WHERE group_id = ?", (group_id,))
+        db.execute('''
+            INSERT OR IGNORE INTO group_members (group_id, machine_id)
+            SELECT g.id, m.id FROM machine_groups g, machines m
+            WHERE g.rule_type IS NOT NULL AND g.id = ? AND (%s)
+        ''' % RULE_MATCH_SQL, (group_id,))
+
+# Bulk commands
+COMMAND_ACTIONS = ['restart', 'shutdown']
+
+TARGET_SQL = {
+    'group': "SELECT machine_id FROM group_members WHERE group_id = ?",
+    'tag': "SELECT machine_id FROM machine_tags WHERE tag = ?",
+}
+
+def dispatch_command(db, action, target_type, target, wave_size, wave_interval, user):
+    """Queue `action` for every machine of a group/tag in a single INSERT ... SELECT.
+
+    Machines are split into waves of `wave_size`; wave N is released
+    N * `wave_interval` seconds after dispatch (wave_size 0 = all at once).
+    """
+    now = datetime.datetime.now()
+    cur = db.execute('''
+        INSERT INTO command_jobs (action, target_type, target, wave_size, wave_interval, created_by, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (action, target_type, target, wave_size, wave_interval, user, now))
+    job_id = cur.lastrowid
+    size = wave_size if wave_size > 0 else 2 ** 31
+    db.execute('''
+        INSERT INTO command_targets (job_id, machine_id, wave, release_at)
+        SELECT ?, machine_id, (rn - 1) / ?, ? + ((rn - 1) / ?) * ?
+        FROM (
+            SELECT machine_id, ROW_NUMBER() OVER (ORDER BY machine_id) AS rn
+            FROM (%s)
+        )
+    ''' % TARGET_SQL[target_type], (job_id, size, now.timestamp(), size, wave_interval, target))
+    return job_id
+
+def resolve_sent_targets(db, machine_id, uptime, now):
+    """A machine reporting again after a command was sent settles it: done if it rebooted since, failed otherwise.
+
+    Covers agents that never ack (older versions) or whose ack was lost while going down.
+    Reports without uptime prove nothing, so the target is left for the timeout.
+    """
+    if uptime is None:
+        return
+    db.execute('''
+        UPDATE command_targets
+        SET status = CASE WHEN ? < (julianday(?) - julianday(sent_at)) * 86400
+                          THEN 'done' ELSE 'failed' END,
+            acked_at = ?, result = ?
+        WHERE machine_id = ? AND status = 'sent'
+    ''', (uptime, now, now, json.dumps({"uptime": uptime}), machine_id))
+
+def expire_command_targets(db):
+    """Settle targets left waiting longer than COMMAND_TIMEOUT seconds.
+
+    Sent targets without an answer fail. Queued targets whose machine did not
+    report in time after their wave was released expire and are never delivered,
+    so an offline machine does not reboot days later in the middle of the day.
+    """
+    now = datetime.datetime.now()
+    changed = db.execute('''
+        UPDATE command_targets SET status = 'failed', acked_at = ?, result = '"timeout"'
+        WHERE status = 'sent' AND sent_at < ?
+    ''', (now, now - datetime.timedelta(seconds=COMMAND_TIMEOUT))).rowcount
+    changed += db.execute('''
+        UPDATE command_targets SET status = 'expired', result = '"timeout"'
+        WHERE status = 'queued' AND release_at < ?
+    ''', (now.timestamp() - COMMAND_TIMEOUT,)).rowcount
+    if changed:
+        db.commit()
+
+JOB_PROGRESS_COLUMNS = '''
+    COUNT(t.machine_id) AS total,
+    COALESCE(SUM(t.status = 'queued'), 0) AS queued,
+    COALESCE(SUM(t.status = 'sent'), 0) AS sent,
+    COALESCE(SUM(t.status = 'done'), 0) AS done,
+    COALESCE(SUM(t.status = 'failed'), 0) AS failed,
+    COALESCE(SUM(t.status = 'expired'), 0) AS expired,
+    COALESCE(SUM(t.status = 'cancelled'), 0) AS cancelled
+'''
+
+
+# Server-side geolocation
+# GEOIP_DB points to a MaxMind .mmdb file (needs `maxminddb`) or to a CSV of
+# ranges: start_ip,end_ip,country,region,city[,latitude,longitude]
+class GeoIPRanges:
+    """IP ranges loaded into sorted arrays and searched with bisect."""
+
+    def __init__(self, path):
+        ranges = []
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                try:
+                    start = ipaddress.ip_address(row[0].strip())
+                    end = ipaddress.ip_address(row[1].strip())
+                except (ValueError, IndexError):
+                    continue # Header or malformed line
+                loc = None
+                if len(row) >= 7 and row[5].strip() and row[6].strip():
+                    loc = "%s,%s" % (row[5].strip(), row[6].strip())
+                ranges.append(((start.version, int(start)), (end.version, int(end)), (row[2], row[3], row[4], loc)))
+        ranges.sort()
+        self.starts = [r[0] for r in ranges]
+        self.ends = [r[1] for r in ranges]
+        self.records = [r[2] for r in ranges]
+
+    def get(self, ip):
+        key = (ip.version, int(ip))
+        i = bisect.bisect_right(self.starts, key) - 1
+        if i < 0 or key > self.ends[i]:
+            return None
+        country, region, city, loc = self.records[i]
+        return {"country": country, "region": region, "city": city, "loc": loc}
+
+class GeoIPMaxMind:
+    def __init__(self, path):
+        self.reader = maxminddb.open_database(path)
+
+    def get(self, ip):
+        data = self.reader.get(str(ip))
+        if not data:
+            return None
+        location = data.get('location', {})
+        subdivisions = data.get('subdivisions') or [{}]
+        loc = None
+        if 'latitude' in location:
+            loc = "%s,%s" % (location['latitude'], location['longitude'])
+        return {
+            "country": data.get('country', {}).get('iso_code'),
+            "region": subdivisions[0].get('names', {}).get('en'),
+            "city": data.get('city', {}).get('names', {}).get('en'),
+            "loc": loc,
+        }
+
+def load_geoip(path):
+    if not path:
+        return None
+    try:
+        if path.endswith('.mmdb'):
+            if maxminddb is None:
+                app.logger.warning("GEOIP_DB is a .mmdb file but maxminddb is not installed")
+                return None
+            return GeoIPMaxMind(path)
+        return GeoIPRanges(path)
+    except Exception as e:
+        app.logger.warning("Could not load GEOIP_DB %s: %s", path, e)
+        return None
+
+geoip = load_geoip(GEOIP_DB)
+
+@functools.lru_cache(maxsize=GEOIP_CACHE_SIZE)
+def lookup_geolocation(ip):
+    """Resolve an IP against the local GeoIP database, or None if it cannot be resolved.
+
+    Cached: agents behind one NAT share the lookup.
+    """
+    if geoip is None:
+        return None
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    record = geoip.get(addr) if addr.is_global else None
+    if record is None:
+        return None
+    return json.dumps(dict(record, ip=ip))
 
 # Auth Decorator
 def login_required(view):
@@ -117,7 +427,13 @@ def machine_detail(id):
     cursor = db.execute('SELECT * FROM machines WHERE id = ?', (id,))
     machine = cursor.fetchone()
     if machine:
-        return render_template('detail.html', machine=machine)
+        tags = db.execute("SELECT tag FROM machine_tags WHERE machine_id = ? ORDER BY tag", (id,)).fetchall()
+        member_of = db.execute('''
+            SELECT g.* FROM group_members gm JOIN machine_groups g ON g.id = gm.group_id
+            WHERE gm.machine_id = ? ORDER BY g.name
+        ''', (id,)).fetchall()
+        manual_groups = db.execute("SELECT id, name FROM machine_groups WHERE rule_type IS NULL ORDER BY name").fetchall()
+        return render_template('detail.html', machine=machine, tags=tags, member_of=member_of, manual_groups=manual_groups)
     return "Machine not found", 404
 
 @app.route('/api/report', methods=['POST'])
@@ -136,17 +452,31 @@ def report():
     uptime = data.get('uptime')
     manufacturer = data.get('manufacturer')
     serial_number = data.get('serial_number')
-    geolocation = json.dumps(data.get('geolocation'))
+    public_ip = request.remote_addr
     installed_software = json.dumps(data.get('software'))
     metrics = json.dumps(data.get('metrics'))
     
     user_info = json.dumps(data.get('user_info'))
     
     now = datetime.datetime.now()
+
+    # public_ip always tracks the source IP. Geolocation is only (re)computed
+    # when it differs from the IP the stored location was resolved for (its
+    # "ip" key); an unresolved lookup (NULL) keeps the old, now stale, location
+    # and is retried on the next report.
+    geolocation = None
+    row = db.execute("SELECT json_extract(geolocation, '$.ip') AS geo_ip FROM machines WHERE id = ?",
+                     (machine_id,)).fetchone()
+    if row is None or row['geo_ip'] != public_ip:
+        if data.get('geolocation'):
+            # Legacy agents with the collector enabled
+            geolocation = json.dumps(data.get('geolocation'))
+        else:
+            geolocation = lookup_geolocation(public_ip)
     
     db.execute('''
-        INSERT INTO machines (id, hostname, ip, os_info, cpu_info, memory_info, disk_info, uptime, last_seen, manufacturer, serial_number, geolocation, installed_software, metrics, user_info)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO machines (id, hostname, ip, os_info, cpu_info, memory_info, disk_info, uptime, last_seen, manufacturer, serial_number, geolocation, installed_software, metrics, user_info, public_ip)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ON CONFLICT(id) DO UPDATE SET
             hostname=excluded.hostname,
             ip=excluded.ip,
@@ -158,14 +488,18 @@ def report():
             last_seen=excluded.last_seen,
             manufacturer=excluded.manufacturer,
             serial_number=excluded.serial_number,
-            geolocation=excluded.geolocation,
+            geolocation=COALESCE(excluded.geolocation, machines.geolocation),
             installed_software=excluded.installed_software,
             metrics=excluded.metrics,
-            user_info=excluded.user_info
-    ''', (machine_id, hostname, ip, os_info, cpu_info, memory_info, disk_info, uptime, now, manufacturer, serial_number, geolocation, installed_software, metrics, user_info))
+            user_info=excluded.user_info,
+            public_ip=excluded.public_ip
+    ''', (machine_id, hostname, ip, os_info, cpu_info, memory_info, disk_info, uptime, now, manufacturer, serial_number, geolocation, installed_software, metrics, user_info, public_ip))
     
+    refresh_rule_groups(db, machine_id=machine_id)
+
     # Check for pending commands to send back to agent
     command = ""
+    command_id = None
     try:
         cur = db.execute("SELECT pending_command FROM machines WHERE id = ?", (machine_id,))
         row = cur.fetchone()
@@ -173,11 +507,39 @@ def report():
             command = row['pending_command']
             # Clear command after sending
             db.execute("UPDATE machines SET pending_command = NULL WHERE id = ?", (machine_id,))
+        else:
+            resolve_sent_targets(db, machine_id, uptime, now)
+            # Bulk job whose wave has already been released
+            cur = db.execute('''
+                SELECT t.job_id, j.action FROM command_targets t
+                JOIN command_jobs j ON j.id = t.job_id
+                WHERE t.machine_id = ? AND t.status = 'queued' AND t.release_at <= ? AND t.release_at >= ?
+                ORDER BY t.release_at LIMIT 1
+            ''', (machine_id, now.timestamp(), now.timestamp() - COMMAND_TIMEOUT))
+            row = cur.fetchone()
+            if row:
+                command = row['action']
+                command_id = row['job_id']
+                db.execute("UPDATE command_targets SET status = 'sent', sent_at = ? WHERE job_id = ? AND machine_id = ?",
+                           (now, command_id, machine_id))
     except:
         pass
 
     db.commit()
-    return jsonify({"status": "success", "message": "Data received", "command": command}), 200
+    return jsonify({"status": "success", "message": "Data received", "command": command, "command_id": command_id}), 200
+
+@app.route('/api/command_ack', methods=['POST'])
+def command_ack():
+    data = request.json
+    machine_id = data.get('uuid') or data.get('serial_number') or data.get('hostname')
+    status = 'done' if data.get('status') == 'done' else 'failed'
+    db = get_db()
+    db.execute('''
+        UPDATE command_targets SET status = ?, acked_at = ?, result = ?
+        WHERE job_id = ? AND machine_id = ? AND status = 'sent'
+    ''', (status, datetime.datetime.now(), json.dumps(data.get('result')), data.get('command_id'), machine_id))
+    db.commit()
+    return jsonify({"status": "success"}), 200
 
 # Ensure DB tables exist when running via Gunicorn
 init_db()
@@ -190,7 +552,302 @@ def machine_action(machine_id):
         db = get_db()
         db.execute("UPDATE machines SET pending_command = ? WHERE id = ?", (action, machine_id))
         db.commit()
-    return redirect(url_for('machine_detail', machine_id=machine_id))
+    return redirect(url_for('machine_detail', id=machine_id))
+
+@app.route('/machine/<machine_id>/tags', methods=['POST'])
+@login_required
+def machine_tags(machine_id):
+    tag = request.form.get('tag', '').strip().lower()
+    if tag:
+        db = get_db()
+        if request.form.get('op') == 'remove':
+            db.execute("DELETE FROM machine_tags WHERE machine_id = ? AND tag = ?", (machine_id, tag))
+        else:
+            db.execute("INSERT OR IGNORE INTO machine_tags (machine_id, tag) VALUES (?, ?)", (machine_id, tag))
+        db.commit()
+    return redirect(url_for('machine_detail', id=machine_id))
+
+@app.route('/machine/<machine_id>/groups', methods=['POST'])
+@login_required
+def machine_groups(machine_id):
+    group_id = request.form.get('group_id', type=int)
+    db = get_db()
+    # Only manual groups accept hand-edited membership
+    group = db.execute("SELECT id FROM machine_groups WHERE id = ? AND rule_type IS NULL", (group_id,)).fetchone()
+    if group:
+        if request.form.get('op') == 'remove':
+            db.execute("DELETE FROM group_members WHERE group_id = ? AND machine_id = ?", (group_id, machine_id))
+        else:
+            db.execute("INSERT OR IGNORE INTO group_members (group_id, machine_id) VALUES (?, ?)", (group_id, machine_id))
+        db.commit()
+    return redirect(url_for('machine_detail', id=machine_id))
+
+@app.route('/groups')
+@login_required
+def groups():
+    db = get_db()
+    expire_command_targets(db)
+    group_rows = db.execute('''
+        SELECT g.*, COUNT(gm.machine_id) AS members FROM machine_groups g
+        LEFT JOIN group_members gm ON gm.group_id = g.id
+        GROUP BY g.id ORDER BY g.name
+    ''').fetchall()
+    tags = db.execute("SELECT tag, COUNT(*) AS members FROM machine_tags GROUP BY tag ORDER BY tag").fetchall()
+    jobs = db.execute('''
+        SELECT j.*, %s FROM command_jobs j
+        LEFT JOIN command_targets t ON t.job_id = j.id
+        GROUP BY j.id ORDER BY j.id DESC LIMIT 20
+    ''' % JOB_PROGRESS_COLUMNS).fetchall()
+    return render_template('groups.html', groups=group_rows, tags=tags, jobs=jobs,
+                           rule_types=GROUP_RULE_TYPES, actions=COMMAND_ACTIONS, error=request.args.get('error'))
+
+@app.route('/groups', methods=['POST'])
+@login_required
+def create_group():
+    name = request.form.get('name', '').strip()
+    rule_type = request.form.get('rule_type') or None
+    rule_value = request.form.get('rule_value', '').strip()
+    if not name:
+        return redirect(url_for('groups', error="Informe o nome do grupo"))
+    if rule_type is not None:
+        if rule_type not in GROUP_RULE_TYPES or not rule_value:
+            return redirect(url_for('groups', error="Regra inválida"))
+        # Keep what the user typed for display next to the compiled LIKE pattern
+        rule_pattern = rule_value
+        rule_value = wildcard_to_like(rule_value)
+    else:
+        rule_pattern = rule_value = None
+
+    db = get_db()
+    try:
+        cur = db.execute('''
+            INSERT INTO machine_groups (name, rule_type, rule_value, rule_pattern, created_at) VALUES (?, ?, ?, ?, ?)
+        ''', (name, rule_type, rule_value, rule_pattern, datetime.datetime.now()))
+    except sqlite3.IntegrityError:
+        return redirect(url_for('groups', error="Já existe um grupo com esse nome"))
+    if rule_type is not None:
+        refresh_rule_groups(db, group_id=cur.lastrowid)
+    db.commit()
+    return redirect(url_for('groups'))
+
+@app.route('/groups/<int:group_id>/delete', methods=['POST'])
+@login_required
+def delete_group(group_id):
+    db = get_db()
+    db.execute("DELETE FROM group_members WHERE group_id = ?", (group_id,))
+    db.execute("DELETE FROM machine_groups WHERE id = ?", (group_id,))
+    db.commit()
+    return redirect(url_for('groups'))
+
+@app.route('/commands', methods=['POST'])
+@login_required
+def create_command():
+    action = request.form.get('action')
+    target = request.form.get('target', '')
+    target_type, _, target_value = target.partition(':')
+    wave_size = max(request.form.get('wave_size', 0, type=int), 0)
+    wave_interval = max(request.form.get('wave_interval', 0, type=int), 0)
+    if action not in COMMAND_ACTIONS or target_type not in TARGET_SQL or not target_value:
+        return redirect(url_for('groups', error="Comando ou alvo inválido"))
+
+    db = get_db()
+    job_id = dispatch_command(db, action, target_type, target_value, wave_size, wave_interval, session.get('user'))
+    db.commit()
+    return redirect(url_for('command_progress', job_id=job_id))
+
+@app.route('/commands/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_command(job_id):
+    db = get_db()
+    # Targets already sent cannot be recalled; only stop what is still queued
+    db.execute("UPDATE command_targets SET status = 'cancelled' WHERE job_id = ? AND status = 'queued'", (job_id,))
+    db.commit()
+    return redirect(url_for('command_progress', job_id=job_id))
+
+def get_job_progress(db, job_id):
+    expire_command_targets(db)
+    job = db.execute('''
+        SELECT j.*, %s FROM command_jobs j
+        LEFT JOIN command_targets t ON t.job_id = j.id
+        WHERE j.id = ? GROUP BY j.id
+    ''' % JOB_PROGRESS_COLUMNS, (job_id,)).fetchone()
+    if job is None:
+        return None, []
+    waves = db.execute('''
+        SELECT t.wave, MIN(t.release_at) AS release_at, %s FROM command_targets t
+        WHERE t.job_id = ? GROUP BY t.wave ORDER BY t.wave
+    ''' % JOB_PROGRESS_COLUMNS, (job_id,)).fetchall()
+    return job, waves
+
+@app.route('/commands/<int:job_id>')
+@login_required
+def command_progress(job_id):
+    job, waves = get_job_progress(get_db(), job_id)
+    if job is None:
+        return "Job not found", 404
+    return render_template('command.html', job=job, waves=waves)
+
+@app.route('/api/commands/<int:job_id>')
+@login_required
+def command_progress_api(job_id):
+    job, waves = get_job_progress(get_db(), job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"job": dict(job), "waves": [dict(w) for w in waves]})
+
+# Streaming export
+# Rows are pulled from a dedicated cursor in chunks and written straight to
+# the response, so memory stays flat regardless of fleet size.
+EXPORT_CHUNK_SIZE = 500
+
+# field -> (SQL expression, stored as JSON text)
+MACHINE_EXPORT_FIELDS = {
+    'id': ('m.id', False),
+    'hostname': ('m.hostname', False),
+    'ip': ('m.ip', False),
+    'os': ('m.os_info', True),
+    'cpu': ('m.cpu_info', True),
+    'memory': ('m.memory_info', True),
+    'disk': ('m.disk_info', True),
+    'uptime': ('m.uptime', False),
+    'last_seen': ('m.last_seen', False),
+    'manufacturer': ('m.manufacturer', False),
+    'serial_number': ('m.serial_number', False),
+    'public_ip': ('m.public_ip', False),
+    'geolocation': ('m.geolocation', True),
+    # 1 when the stored location was resolved for an IP other than the current one
+    'geolocation_stale': ("(m.geolocation IS NOT NULL AND json_extract(m.geolocation, '$.ip') IS NOT m.public_ip)", False),
+    'software': ('m.installed_software', True),
+    'metrics': ('m.metrics', True),
+    'user_info': ('m.user_info', True),
+}
+MACHINE_EXPORT_DEFAULT = ['id', 'hostname', 'ip', 'os', 'manufacturer', 'serial_number', 'uptime', 'last_seen']
+
+SOFTWARE_EXPORT_FIELDS = {
+    'machine_id': ('m.id', False),
+    'hostname': ('m.hostname', False),
+    'name': ("json_extract(s.value, '$.name')", False),
+    'version': ("json_extract(s.value, '$.version')", False),
+    'vendor': ("json_extract(s.value, '$.vendor')", False),
+}
+SOFTWARE_EXPORT_DEFAULT = list(SOFTWARE_EXPORT_FIELDS)
+
+def export_fields(available, default):
+    requested = request.args.get('fields')
+    if not requested:
+        return default
+    fields = [f.strip() for f in requested.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in available]
+    if unknown or not fields:
+        return None
+    return fields
+
+def machine_export_filters():
+    """Build WHERE clauses shared by both exports from the query string."""
+    clauses, params = [], []
+    for arg, expr in (('hostname', 'm.hostname'), ('manufacturer', 'm.manufacturer'),
+                      ('os', "(COALESCE(json_extract(m.os_info, '$.system'), '') || ' ' || "
+                             "COALESCE(json_extract(m.os_info, '$.release'), ''))")):
+        if request.args.get(arg):
+            clauses.append(expr + " LIKE ? ESCAPE '\\'")
+            params.append(wildcard_to_like(request.args[arg]))
+    if request.args.get('group'):
+        clauses.append("m.id IN (SELECT machine_id FROM group_members WHERE group_id = ?)")
+        params.append(request.args.get('group', type=int))
+    if request.args.get('tag'):
+        clauses.append("m.id IN (SELECT machine_id FROM machine_tags WHERE tag = ?)")
+        params.append(request.args['tag'].strip().lower())
+    if request.args.get('since'):
+        clauses.append("m.last_seen >= ?")
+        params.append(request.args['since'])
+    return clauses, params
+
+def encode_ndjson(rows, fields, spec):
+    # JSON columns already hold serialized JSON, so they are spliced in as-is
+    # instead of being decoded and re-encoded.
+    lines = []
+    for row in rows:
+        parts = []
+        for i, field in enumerate(fields):
+            value = row[i]
+            if spec[field][1]:
+                value = value if value is not None else 'null'
+            else:
+                value = json.dumps(value, default=str)
+            parts.append('%s: %s' % (json.dumps(field), value))
+        lines.append('{' + ', '.join(parts) + '}\n')
+    return ''.join(lines)
+
+def encode_csv(rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue()
+
+def stream_export(name, sql, params, fields, spec):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({"error": "Unsupported format"}), 400
+    compress = request.args.get('gzip') in ('1', 'true')
+
+    def generate():
+        # Own connection: the request-scoped one is closed before the stream ends
+        db = sqlite3.connect(DB_FILE)
+        try:
+            cur = db.execute(sql, params)
+            if fmt == 'csv':
+                yield encode_csv([fields])
+            while True:
+                rows = cur.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                yield encode_ndjson(rows, fields, spec) if fmt == 'ndjson' else encode_csv(rows)
+        finally:
+            db.close()
+
+    def generate_gzip():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in generate():
+            data = compressor.compress(chunk.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    filename = '%s.%s' % (name, fmt)
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(generate_gzip() if compress else generate(), mimetype=mimetype,
+                    headers={'Content-Disposition': 'attachment; filename=%s' % filename})
+
+@app.route('/api/export/machines')
+@login_required
+def export_machines():
+    fields = export_fields(MACHINE_EXPORT_FIELDS, MACHINE_EXPORT_DEFAULT)
+    if fields is None:
+        return jsonify({"error": "Unknown field", "available": list(MACHINE_EXPORT_FIELDS)}), 400
+    clauses, params = machine_export_filters()
+    sql = 'SELECT %s FROM machines m' % ', '.join(MACHINE_EXPORT_FIELDS[f][0] for f in fields)
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    return stream_export('machines', sql + ' ORDER BY m.id', params, fields, MACHINE_EXPORT_FIELDS)
+
+@app.route('/api/export/software')
+@login_required
+def export_software():
+    fields = export_fields(SOFTWARE_EXPORT_FIELDS, SOFTWARE_EXPORT_DEFAULT)
+    if fields is None:
+        return jsonify({"error": "Unknown field", "available": list(SOFTWARE_EXPORT_FIELDS)}), 400
+    clauses, params = machine_export_filters()
+    clauses.insert(0, "s.type = 'object'")
+    for arg in ('name', 'vendor'):
+        if request.args.get(arg):
+            clauses.append("json_extract(s.value, '$.%s') LIKE ? ESCAPE '\\'" % arg)
+            params.append(wildcard_to_like(request.args[arg]))
+    # One row per installed package, unnested by SQLite itself
+    sql = 'SELECT %s FROM machines m, json_each(m.installed_software) s WHERE %s ORDER BY m.id' % (
+        ', '.join(SOFTWARE_EXPORT_FIELDS[f][0] for f in fields), ' AND '.join(clauses))
+    return stream_export('software', sql, params, fields, SOFTWARE_EXPORT_FIELDS)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
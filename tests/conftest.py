@@ -0,0 +1,24 @@
+import os
+import sys
+import sqlite3
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+# app.py creates its tables at import time; keep that away from the working copy
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(), 'import.db'))
+
+import app as server
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, initialised database connection per test."""
+    path = str(tmp_path / 'machines.db')
+    monkeypatch.setattr(server, 'DB_FILE', path)
+    server.init_db()
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
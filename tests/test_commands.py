@@ -0,0 +1,56 @@
+import pytest
+
+from app import wildcard_to_like, dispatch_command, refresh_rule_groups
+
+
+@pytest.mark.parametrize('pattern, expected', [
+    ('LAB-*', 'LAB-%'),
+    ('PC?01', 'PC_01'),
+    ('PC_01', 'PC\\_01'),
+    ('100%*', '100\\%%'),
+    ('C:\\Temp*', 'C:\\\\Temp%'),
+    ('  Dell*  ', 'Dell%'),
+])
+def test_wildcard_to_like(pattern, expected):
+    assert wildcard_to_like(pattern) == expected
+
+
+def add_machines(db, *hostnames):
+    db.executemany("INSERT INTO machines (id, hostname) VALUES (?, ?)", [(h, h) for h in hostnames])
+
+
+def test_rule_group_matches_literal_underscore(db):
+    add_machines(db, 'PC_01', 'PCX01')
+    db.execute("INSERT INTO machine_groups (id, name, rule_type, rule_value) VALUES (1, 'pc', 'hostname', ?)",
+               (wildcard_to_like('PC_01'),))
+    refresh_rule_groups(db, group_id=1)
+    assert [r['machine_id'] for r in db.execute("SELECT machine_id FROM group_members")] == ['PC_01']
+
+
+def targets(db, job_id):
+    job = db.execute("SELECT created_at FROM command_jobs WHERE id = ?", (job_id,)).fetchone()
+    rows = db.execute("SELECT machine_id, wave, release_at FROM command_targets WHERE job_id = ? ORDER BY machine_id",
+                      (job_id,)).fetchall()
+    return job, rows
+
+
+def test_dispatch_command_waves(db):
+    add_machines(db, 'A', 'B', 'C', 'D', 'E')
+    db.executemany("INSERT INTO machine_tags (machine_id, tag) VALUES (?, 'patch')", [(m,) for m in 'ABCDE'])
+    job_id = dispatch_command(db, 'restart', 'tag', 'patch', 2, 60, 'tester')
+    _, rows = targets(db, job_id)
+
+    assert [(r['machine_id'], r['wave']) for r in rows] == [('A', 0), ('B', 0), ('C', 1), ('D', 1), ('E', 2)]
+    start = rows[0]['release_at']
+    assert [r['release_at'] - start for r in rows] == [0, 0, 60, 60, 120]
+
+
+def test_dispatch_command_single_wave(db):
+    add_machines(db, 'A', 'B', 'C')
+    db.execute("INSERT INTO machine_groups (id, name) VALUES (1, 'all')")
+    db.executemany("INSERT INTO group_members (group_id, machine_id) VALUES (1, ?)", [(m,) for m in 'ABC'])
+    job_id = dispatch_command(db, 'shutdown', 'group', 1, 0, 300, 'tester')
+    _, rows = targets(db, job_id)
+
+    assert {r['wave'] for r in rows} == {0}
+    assert len({r['release_at'] for r in rows}) == 1
@@ -0,0 +1,22 @@
+import json
+
+from app import MACHINE_EXPORT_FIELDS, encode_ndjson, encode_csv
+
+
+def test_encode_ndjson_splices_json_columns():
+    fields = ['id', 'os', 'geolocation', 'uptime']
+    rows = [
+        ('M1', '{"system": "Windows"}', None, 12.5),
+        ('M2', 'null', '{"city": "Recife"}', None),
+    ]
+    lines = encode_ndjson(rows, fields, MACHINE_EXPORT_FIELDS).splitlines()
+
+    assert [json.loads(line) for line in lines] == [
+        {"id": "M1", "os": {"system": "Windows"}, "geolocation": None, "uptime": 12.5},
+        {"id": "M2", "os": None, "geolocation": {"city": "Recife"}, "uptime": None},
+    ]
+
+
+def test_encode_csv_keeps_json_as_text():
+    out = encode_csv([('M1', '{"a": 1}', None)])
+    assert out == 'M1,"{""a"": 1}",\r\n'
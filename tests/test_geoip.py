@@ -0,0 +1,64 @@
+import ipaddress
+
+import pytest
+
+import app as server
+from app import GeoIPRanges
+
+
+@pytest.fixture
+def ranges(tmp_path):
+    path = tmp_path / 'geo.csv'
+    path.write_text(
+        "start_ip,end_ip,country,region,city,latitude,longitude\n"
+        "8.8.8.0,8.8.8.255,US,California,Mountain View,37.4,-122.0\n"
+        "200.160.0.0,200.160.15.255,BR,Sao Paulo,Sao Paulo,,\n"
+        "2001:4860::,2001:4860:ffff:ffff:ffff:ffff:ffff:ffff,US,California,Mountain View\n"
+        "not an ip,line,XX,,\n"
+    )
+    return GeoIPRanges(str(path))
+
+
+def lookup(ranges, ip):
+    record = ranges.get(ipaddress.ip_address(ip))
+    return record and record['country']
+
+
+@pytest.mark.parametrize('ip, country', [
+    ('8.8.8.0', 'US'),
+    ('8.8.8.255', 'US'),
+    ('8.8.7.255', None),
+    ('8.8.9.0', None),
+    ('200.160.15.255', 'BR'),
+    ('200.160.16.0', None),
+    ('0.0.0.0', None),
+    ('255.255.255.255', None),
+])
+def test_ipv4_boundaries(ranges, ip, country):
+    assert lookup(ranges, ip) == country
+
+
+def test_ipv6_lookup(ranges):
+    assert lookup(ranges, '2001:4860::8888') == 'US'
+    assert lookup(ranges, '2001:4861::') is None
+
+
+def test_ipv6_does_not_match_ipv4_range_with_same_integer(ranges):
+    # ::808:808 has the same integer value as 8.8.8.8
+    assert lookup(ranges, '::808:808') is None
+
+
+def test_location(ranges):
+    assert ranges.get(ipaddress.ip_address('8.8.8.8'))['loc'] == '37.4,-122.0'
+    assert ranges.get(ipaddress.ip_address('200.160.1.1'))['loc'] is None
+
+
+def test_lookup_geolocation_unresolved_is_none(ranges, monkeypatch):
+    monkeypatch.setattr(server, 'geoip', ranges)
+    server.lookup_geolocation.cache_clear()
+    try:
+        assert server.lookup_geolocation('10.0.0.1') is None
+        assert server.lookup_geolocation('9.9.9.9') is None
+        assert server.lookup_geolocation('8.8.8.8') is not None
+    finally:
+        server.lookup_geolocation.cache_clear()